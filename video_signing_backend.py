@@ -5,25 +5,34 @@ Integrates with Axis Signed Video Framework to sign video content from mobile de
 """
 
 import os
+import asyncio
+import time
 import subprocess
 import tempfile
 import logging
+from contextlib import asynccontextmanager
+from collections import Counter
 from pathlib import Path
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, Tuple
 from dataclasses import dataclass
 from datetime import datetime
 import hashlib
-import json
+from urllib.parse import quote
+from concurrent.futures import ThreadPoolExecutor
 
 # Web framework imports (using FastAPI as example)
-from fastapi import FastAPI, File, UploadFile, HTTPException, BackgroundTasks
-from fastapi.responses import FileResponse
+from fastapi import FastAPI, File, UploadFile, HTTPException, BackgroundTasks, Depends, Request, WebSocket
+from fastapi.responses import FileResponse, JSONResponse, ORJSONResponse, StreamingResponse
+from starlette.concurrency import run_in_threadpool
 import uvicorn
+import aiofiles
+import orjson
 
 # Database imports (using SQLAlchemy as example)
-from sqlalchemy import create_engine, Column, Integer, String, DateTime, LargeBinary, Boolean
-from sqlalchemy.orm import sessionmaker, Session
+from sqlalchemy import Column, Integer, String, DateTime, LargeBinary, Boolean, event, select, update
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.orm import declarative_base
+from sqlalchemy.pool import AsyncAdaptedQueuePool
 
 Base = declarative_base()
 
@@ -46,22 +55,91 @@ class SigningConfig:
     # Private key password (for development - use secure key management in production)
     private_key_password: str = os.getenv("PRIVATE_KEY_PASSWORD", "")
     
+    # Long-lived signer wrapper that reads one JSON job per line on stdin
+    # ({"input": ..., "output": ...}) and answers each with a status line
+    # ("0" on success, otherwise "<code> <message>"). When unset, the signer
+    # is launched once per video.
+    signer_worker_executable: str = os.getenv("SIGNER_WORKER_EXECUTABLE", "")
+    
     # Temporary directory for processing
     temp_dir: str = os.getenv("TEMP_DIR", "/tmp/video-signing")
     
+    # Directory signed videos are written to and served from
+    persistent_dir: str = os.getenv("PERSISTENT_DIR", "./signed-videos")
+    
+    # Size budget for persistent_dir in bytes; least recently downloaded
+    # videos are evicted once it is exceeded (0 disables eviction)
+    persistent_dir_max_bytes: int = int(os.getenv("PERSISTENT_DIR_MAX_BYTES", "0"))
+    
+    # Largest accepted upload in bytes
+    max_upload_bytes: int = int(os.getenv("MAX_UPLOAD_BYTES", str(5 * 1024 ** 3)))
+    
     # Supported video formats
-    supported_formats: list = None
+    supported_formats: frozenset = None
     
     def __post_init__(self):
         if self.supported_formats is None:
-            self.supported_formats = ['.mp4', '.mov', '.avi', '.mkv', '.m4v']
+            self.supported_formats = frozenset({'.mp4', '.mov', '.avi', '.mkv', '.m4v'})
+        else:
+            self.supported_formats = frozenset(self.supported_formats)
 
 config = SigningConfig()
 
+# Size of each read when streaming uploads to disk and downloads to clients
+CHUNK_SIZE = 1 << 20
+
+# GStreamer plugin locations needed by the signer
+GST_PLUGIN_PATH = '/usr/lib/x86_64-linux-gnu/gstreamer-1.0:/usr/local/lib/gstreamer-1.0'
+
+# Maximum time a single signing job may take
+SIGNING_TIMEOUT = 300  # 5 minutes
+
+# How much of the signer's stderr is kept for error messages
+STDERR_TAIL_BYTES = 4096
+
+# Container signatures expected at the start of each supported format: a
+# file matches if all (offset, bytes) pairs of any one alternative match
+CONTAINER_SIGNATURES = {
+    '.mp4': [[(4, b'ftyp')]],
+    '.m4v': [[(4, b'ftyp')]],
+    '.mov': [[(4, b'ftyp')], [(4, b'moov')], [(4, b'mdat')], [(4, b'wide')], [(4, b'free')], [(4, b'skip')]],
+    '.avi': [[(0, b'RIFF'), (8, b'AVI ')]],
+    '.mkv': [[(0, b'\x1a\x45\xdf\xa3')]],
+}
+
+# How often a status WebSocket re-checks a video signed by another process
+STATUS_POLL_INTERVAL = 1  # seconds
+
+# Longest a status WebSocket waits before sending whatever the status is
+STATUS_WAIT_TIMEOUT = SIGNING_TIMEOUT + 60  # seconds
+
+# Maximum number of upload records committed in one transaction
+INSERT_BATCH_SIZE = 100
+
 # Database setup
-DATABASE_URL = "sqlite:///./signed_videos.db"
-engine = create_engine(DATABASE_URL)
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+DATABASE_URL = "sqlite+aiosqlite:///./signed_videos.db"
+engine = create_async_engine(
+    DATABASE_URL,
+    connect_args={"check_same_thread": False, "timeout": 30},
+    poolclass=AsyncAdaptedQueuePool,
+    # SQLite's page cache is per connection: up to 30 connections at the
+    # 8 MiB cache_size set below is at most 240 MiB
+    pool_size=20,
+    max_overflow=10,
+    pool_pre_ping=True
+)
+AsyncSessionLocal = async_sessionmaker(engine, expire_on_commit=False)
+
+@event.listens_for(engine.sync_engine, "connect")
+def set_sqlite_pragmas(dbapi_connection, connection_record):
+    """Use WAL so status/download reads don't block on signing writes"""
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.execute("PRAGMA cache_size=-8192")  # 8 MiB per connection
+    cursor.execute("PRAGMA mmap_size=268435456")  # 256 MiB
+    cursor.close()
+
 Base = declarative_base()
 
 class SignedVideo(Base):
@@ -78,34 +156,97 @@ class SignedVideo(Base):
     signing_status = Column(String, default="pending")
     error_message = Column(String, nullable=True)
 
-Base.metadata.create_all(bind=engine)
+class UploadSizeLimitMiddleware:
+    """Reject uploads whose declared Content-Length is too large before the body is read"""
+    
+    def __init__(self, app, path: str, max_bytes: int):
+        self.app = app
+        self.path = path
+        self.max_bytes = max_bytes
+    
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http" and scope["path"] == self.path:
+            for name, value in scope["headers"]:
+                if name == b"content-length":
+                    if value.isdigit() and int(value) > self.max_bytes:
+                        response = JSONResponse(
+                            status_code=413,
+                            content={"detail": f"Upload exceeds maximum size of {self.max_bytes} bytes"}
+                        )
+                        await response(scope, receive, send)
+                        return
+                    break
+        await self.app(scope, receive, send)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Start the database, signing service and batch writer, and stop them in reverse on shutdown"""
+    await create_tables()
+    await start_signing_service()
+    await start_batch_writer()
+    try:
+        yield
+    finally:
+        await stop_batch_writer()
+        await stop_signer_workers()
 
 # FastAPI app
-app = FastAPI(title="Video Signing Service", version="1.0.0")
+app = FastAPI(title="Video Signing Service", version="1.0.0", default_response_class=ORJSONResponse, lifespan=lifespan)
+app.add_middleware(UploadSizeLimitMiddleware, path="/upload-video/", max_bytes=config.max_upload_bytes)
 
 class VideoSigningService:
     """Service class to handle video signing operations"""
     
     def __init__(self, config: SigningConfig):
         self.config = config
+        
+        # Environment for signer processes, built once rather than per job
+        self._env = os.environ.copy()
+        self._env['GST_PLUGIN_PATH'] = GST_PLUGIN_PATH
+        
+        # Key arguments and signer command prefix, built once rather than per
+        # job; only --input/--output vary between videos
+        self._key_args = ["--key", self.config.private_key_path]
+        if self.config.private_key_password:
+            self._key_args.extend(["--key-password", self.config.private_key_password])
+        self._base_cmd = [self.config.signer_executable, *self._key_args, "--verbose"]
+        
+        # Pool of persistent signer workers, populated by start_workers()
+        self._workers: Optional[asyncio.Queue] = None
+        
+        # Background restarts of workers abandoned by cancelled jobs
+        self._worker_restarts: set = set()
+        
+        # Signed videos that records are about to reference, which eviction
+        # must leave alone (see hold_output); counted, since concurrent
+        # uploads of the same content can hold the same file
+        self._held_outputs: Counter = Counter()
+        
         self.ensure_directories()
-        self.validate_dependencies()
+        # Checked once per process; the health check reports these
+        self.dependencies = self.validate_dependencies()
     
     def ensure_directories(self):
         """Ensure required directories exist"""
         os.makedirs(self.config.temp_dir, exist_ok=True)
+        os.makedirs(self.config.persistent_dir, exist_ok=True)
         
-    def validate_dependencies(self):
-        """Validate that required dependencies are available"""
+    def validate_dependencies(self) -> Dict[str, bool]:
+        """Validate that required dependencies are available, returning which ones exist"""
+        dependencies = {
+            "signed_video_lib": os.path.exists(self.config.signed_video_lib_path),
+            "signer_executable": os.path.exists(self.config.signer_executable),
+            "private_key": os.path.exists(self.config.private_key_path)
+        }
         missing_deps = []
         
-        if not os.path.exists(self.config.signed_video_lib_path):
+        if not dependencies["signed_video_lib"]:
             missing_deps.append(f"Signed video library: {self.config.signed_video_lib_path}")
             
-        if not os.path.exists(self.config.signer_executable):
+        if not dependencies["signer_executable"]:
             missing_deps.append(f"Signer executable: {self.config.signer_executable}")
             
-        if not os.path.exists(self.config.private_key_path):
+        if not dependencies["private_key"]:
             missing_deps.append(f"Private key: {self.config.private_key_path}")
         
         if missing_deps:
@@ -126,23 +267,118 @@ class VideoSigningService:
                 logger.warning(f"Signer executable returned code {result.returncode}")
         except Exception as e:
             logger.error(f"Failed to test signer executable: {e}")
+        
+        return dependencies
     
-    def calculate_file_hash(self, file_path: str) -> str:
-        """Calculate SHA-256 hash of file"""
-        hash_sha256 = hashlib.sha256()
-        with open(file_path, "rb") as f:
-            for chunk in iter(lambda: f.read(4096), b""):
-                hash_sha256.update(chunk)
-        return hash_sha256.hexdigest()
+    def hold_output(self, path: str):
+        """Protect a signed video from eviction until release_output() is called"""
+        self._held_outputs[path] += 1
+    
+    def release_output(self, path: str):
+        """Allow a held signed video to be evicted again"""
+        self._held_outputs[path] -= 1
+        if self._held_outputs[path] <= 0:
+            del self._held_outputs[path]
+    
+    def evict_signed_videos(self):
+        """
+        Delete least recently used signed videos until persistent_dir fits its size budget
+        
+        Held videos (still being signed, or about to be referenced by a new
+        record) count towards the budget but are never evicted.
+        """
+        max_bytes = self.config.persistent_dir_max_bytes
+        if not max_bytes:
+            return
+        
+        videos = []
+        with os.scandir(self.config.persistent_dir) as entries:
+            for entry in entries:
+                if entry.is_file():
+                    stat_result = entry.stat()
+                    videos.append((stat_result.st_atime, stat_result.st_size, entry.path))
+        
+        total_bytes = sum(size for _, size, _ in videos)
+        for _, size, path in sorted(videos):
+            if total_bytes <= max_bytes:
+                break
+            # An empty file is an output mkstemp has only just reserved, and
+            # may not be held yet; deleting it would free nothing anyway
+            if size == 0 or path in self._held_outputs:
+                continue
+            try:
+                os.unlink(path)
+                logger.info(f"Evicted signed video {path}")
+            except FileNotFoundError:
+                pass
+            total_bytes -= size
+    
+    def is_supported_format(self, suffix: str) -> bool:
+        """Check if file format is supported, given its lowercased extension (e.g. ".mp4")"""
+        return suffix in self.config.supported_formats
+    
+    def has_valid_container(self, suffix: str, header: bytes) -> bool:
+        """Check that the file starts with the container signature its extension implies"""
+        signatures = CONTAINER_SIGNATURES.get(suffix, [])
+        return any(
+            all(header[offset:offset + len(magic)] == magic for offset, magic in signature)
+            for signature in signatures
+        )
+    
+    async def start_workers(self):
+        """Start one persistent signer worker per CPU, if configured"""
+        if not self.config.signer_worker_executable:
+            return
+        
+        workers = asyncio.Queue()
+        for _ in range(os.cpu_count() or 1):
+            workers.put_nowait(await self._spawn_worker())
+        self._workers = workers
+        logger.info(f"Started {workers.qsize()} persistent signer workers")
+    
+    async def stop_workers(self):
+        """Shut down persistent signer workers"""
+        if self._workers is None:
+            return
+        
+        workers, self._workers = self._workers, None
+        while not workers.empty():
+            worker = workers.get_nowait()
+            worker.stdin.close()
+            try:
+                await asyncio.wait_for(worker.wait(), timeout=10)
+            except asyncio.TimeoutError:
+                worker.kill()
+    
+    async def _spawn_worker(self) -> asyncio.subprocess.Process:
+        """Launch a signer worker with the key loaded once for its lifetime"""
+        return await asyncio.create_subprocess_exec(
+            self.config.signer_worker_executable,
+            *self._key_args,
+            stdin=asyncio.subprocess.PIPE,
+            stdout=asyncio.subprocess.PIPE,
+            env=self._env
+        )
     
-    def is_supported_format(self, filename: str) -> bool:
-        """Check if file format is supported"""
-        return Path(filename).suffix.lower() in self.config.supported_formats
+    async def _replace_worker(self, workers: asyncio.Queue, worker: asyncio.subprocess.Process):
+        """Kill a worker in an unknown state and put a fresh one in the pool"""
+        if worker.returncode is None:
+            worker.kill()
+        try:
+            worker = await self._spawn_worker()
+        except Exception as e:
+            # Keep the pool size; the next job to take the dead worker tries
+            # the restart again before using it
+            logger.error(f"Failed to restart signer worker: {e}")
+        workers.put_nowait(worker)
     
-    def sign_video(self, input_path: str, output_path: str) -> Dict[str, Any]:
+    async def sign_video(self, input_path: str, output_path: str) -> Dict[str, Any]:
         """
         Sign video using Axis Signed Video Framework
         
+        Uses a persistent signer worker when the pool is running, otherwise
+        launches the signer executable for this video.
+        
         Args:
             input_path: Path to input video file
             output_path: Path where signed video will be saved
@@ -150,90 +386,168 @@ class VideoSigningService:
         Returns:
             Dictionary with signing results
         """
+        if self._workers is not None:
+            return await self._sign_with_worker(input_path, output_path)
+        
+        return await self._sign_with_subprocess(input_path, output_path)
+    
+    async def _sign_with_worker(self, input_path: str, output_path: str) -> Dict[str, Any]:
+        """Hand a signing job to an idle persistent worker"""
+        # JSON escapes tabs and newlines, so client-derived filenames can't
+        # break the one-job-per-line framing
+        job = orjson.dumps({"input": input_path, "output": output_path}) + b"\n"
+        
+        workers = self._workers
+        worker = await workers.get()
+        if worker.returncode is not None:
+            try:
+                worker = await self._spawn_worker()
+            except Exception as e:
+                # Don't fail the video because the pool is degraded
+                logger.error(f"Failed to restart signer worker, signing with a subprocess: {e}")
+                workers.put_nowait(worker)
+                return await self._sign_with_subprocess(input_path, output_path)
+            except asyncio.CancelledError:
+                workers.put_nowait(worker)
+                raise
+        try:
+            worker.stdin.write(job)
+            await worker.stdin.drain()
+            status = await asyncio.wait_for(worker.stdout.readline(), timeout=SIGNING_TIMEOUT)
+            if not status:
+                raise RuntimeError(f"signer worker exited with code {await worker.wait()}")
+        except asyncio.CancelledError:
+            # The worker may still owe a status line for this job, so it must
+            # not go back into the pool; restart it without blocking the
+            # cancellation
+            restart = asyncio.create_task(self._replace_worker(workers, worker))
+            self._worker_restarts.add(restart)
+            restart.add_done_callback(self._worker_restarts.discard)
+            raise
+        except Exception as e:
+            # The worker's state is unknown, so replace it
+            await self._replace_worker(workers, worker)
+            if isinstance(e, asyncio.TimeoutError):
+                return {
+                    "success": False,
+                    "error": "Signing process timed out"
+                }
+            return {
+                "success": False,
+                "error": f"Signing process failed: {str(e)}"
+            }
+        
+        workers.put_nowait(worker)
+        code, _, message = status.decode(errors="replace").strip().partition(" ")
+        if code == "0":
+            return {
+                "success": True,
+                "output_path": output_path
+            }
+        return {
+            "success": False,
+            "error": f"Signing failed with code {code}: {message}"
+        }
+    
+    async def _sign_with_subprocess(self, input_path: str, output_path: str) -> Dict[str, Any]:
+        """Sign a single video by launching the signer executable"""
         try:
             # Prepare signing command
             # This assumes the signer executable from the examples repository
-            cmd = [
-                self.config.signer_executable,
-                "--input", input_path,
-                "--output", output_path,
-                "--key", self.config.private_key_path
-            ]
-            
-            # Add password if provided
-            if self.config.private_key_password:
-                cmd.extend(["--key-password", self.config.private_key_password])
-            
-            # Add verbose flag for debugging
-            cmd.append("--verbose")
+            cmd = self._base_cmd + ["--input", input_path, "--output", output_path]
             
-            logger.info(f"Executing signing command: {' '.join(cmd[:-2])}... [password hidden]")
+            if logger.isEnabledFor(logging.INFO):
+                logger.info(f"Executing signing command: {self.config.signer_executable} --input {input_path} --output {output_path} [key options hidden]")
             
-            # Set environment variables for GStreamer
-            env = os.environ.copy()
-            env['GST_PLUGIN_PATH'] = '/usr/lib/x86_64-linux-gnu/gstreamer-1.0:/usr/local/lib/gstreamer-1.0'
-            
-            # Execute signing process
-            result = subprocess.run(
-                cmd,
-                capture_output=True,
-                text=True,
-                timeout=300,  # 5 minute timeout
-                env=env
+            # Execute signing process; only the end of stderr is kept, for the
+            # error message, since --verbose output can be large
+            process = await asyncio.create_subprocess_exec(
+                *cmd,
+                stdout=asyncio.subprocess.DEVNULL,
+                stderr=asyncio.subprocess.PIPE,
+                env=self._env
             )
+            try:
+                stderr_tail = await asyncio.wait_for(self._wait_for_signer(process), timeout=SIGNING_TIMEOUT)
+            except asyncio.TimeoutError:
+                process.kill()
+                await process.wait()
+                return {
+                    "success": False,
+                    "error": "Signing process timed out"
+                }
             
-            if result.returncode == 0:
+            if process.returncode == 0:
                 return {
                     "success": True,
-                    "output_path": output_path,
-                    "stdout": result.stdout,
-                    "stderr": result.stderr
+                    "output_path": output_path
                 }
             else:
                 return {
                     "success": False,
-                    "error": f"Signing failed with code {result.returncode}",
-                    "stdout": result.stdout,
-                    "stderr": result.stderr
+                    "error": f"Signing failed with code {process.returncode}: {stderr_tail.decode('utf-8', 'replace').strip()}"
                 }
                 
-        except subprocess.TimeoutExpired:
-            return {
-                "success": False,
-                "error": "Signing process timed out"
-            }
         except Exception as e:
             return {
                 "success": False,
                 "error": f"Signing process failed: {str(e)}"
             }
     
-    def process_video_file(self, file_path: str, original_filename: str, device_info: Dict = None) -> Dict[str, Any]:
+    @staticmethod
+    def remove_output(output_path: str):
+        """Delete a signing job's output file, if it exists"""
+        try:
+            os.unlink(output_path)
+        except FileNotFoundError:
+            pass
+    
+    @staticmethod
+    async def _wait_for_signer(process: asyncio.subprocess.Process) -> bytes:
+        """Wait for a signer process to exit, returning the last STDERR_TAIL_BYTES of its stderr"""
+        stderr_tail = b""
+        while chunk := await process.stderr.read(STDERR_TAIL_BYTES):
+            stderr_tail = (stderr_tail + chunk)[-STDERR_TAIL_BYTES:]
+        await process.wait()
+        return stderr_tail
+    
+    async def process_video_file(self, file_path: str, original_filename: str, file_hash: str, device_info: Dict = None) -> Dict[str, Any]:
         """
         Complete video processing pipeline
         
         Args:
             file_path: Path to uploaded video file
             original_filename: Original filename from mobile device
+            file_hash: SHA-256 of the uploaded file, computed once at upload time
             device_info: Device metadata from mobile app
             
         Returns:
-            Processing results
+            Processing results. On success the signed video stays held
+            against eviction; the caller releases it once its record is saved
         """
+        output_path = None
         try:
-            # Calculate file hash for integrity verification
-            file_hash = self.calculate_file_hash(file_path)
-            
-            # Generate output filename
+            # Generate output filename; mkstemp reserves a name no concurrent
+            # job can share, so the file at output_path is always this job's
             timestamp = datetime.utcnow().strftime("%Y%m%d_%H%M%S")
             base_name = Path(original_filename).stem
-            output_filename = f"{base_name}_signed_{timestamp}.mp4"
-            output_path = os.path.join(self.config.temp_dir, output_filename)
+            # Written straight to persistent storage, so temp_dir (ideally a
+            # tmpfs) only ever holds the upload
+            fd, output_path = tempfile.mkstemp(
+                dir=self.config.persistent_dir,
+                prefix=f"{base_name}_signed_{timestamp}_",
+                suffix=".mp4"
+            )
+            os.close(fd)
+            self.hold_output(output_path)
+            output_filename = os.path.basename(output_path)
             
             # Sign the video
-            signing_result = self.sign_video(file_path, output_path)
+            signing_result = await self.sign_video(file_path, output_path)
             
             if signing_result["success"]:
+                loop = asyncio.get_running_loop()
+                await loop.run_in_executor(executor, self.evict_signed_videos)
                 return {
                     "success": True,
                     "signed_file_path": output_path,
@@ -242,6 +556,9 @@ class VideoSigningService:
                     "signing_details": signing_result
                 }
             else:
+                # Don't leave partial output behind
+                self.release_output(output_path)
+                self.remove_output(output_path)
                 return {
                     "success": False,
                     "error": signing_result["error"],
@@ -249,22 +566,121 @@ class VideoSigningService:
                 }
                 
         except Exception as e:
+            if output_path:
+                self.release_output(output_path)
+                self.remove_output(output_path)
             logger.error(f"Video processing failed: {str(e)}")
             return {
                 "success": False,
                 "error": f"Processing failed: {str(e)}"
             }
 
-# Initialize service
-signing_service = VideoSigningService(config)
+# Signing service, created once per process at startup
+signing_service: Optional[VideoSigningService] = None
+
+# Worker pool for hashing so it doesn't block the event loop
+executor = ThreadPoolExecutor(max_workers=os.cpu_count())
+
+# New upload records waiting for the batch writer, paired with a future
+# that receives the record's id once committed
+pending_inserts: Optional[asyncio.Queue] = None
+batch_writer_task: Optional[asyncio.Task] = None
+
+# Videos being signed in this process, set once their outcome is recorded
+status_events: Dict[int, asyncio.Event] = {}
+
+async def create_tables():
+    """Create database tables"""
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
 
-def get_db():
+async def start_signing_service():
+    """Initialize the signing service and its persistent workers"""
+    global signing_service
+    # Constructing the service runs the blocking `signer --help` probe
+    signing_service = await run_in_threadpool(VideoSigningService, config)
+    await signing_service.start_workers()
+
+async def start_batch_writer():
+    """Start the background task that commits upload records"""
+    global pending_inserts, batch_writer_task
+    # Created here rather than at import so it belongs to the running loop
+    queue = asyncio.Queue()
+    pending_inserts = queue
+    batch_writer_task = asyncio.create_task(write_pending_inserts(queue))
+    batch_writer_task.add_done_callback(lambda task: fail_pending_inserts(queue, task))
+
+async def stop_signer_workers():
+    """Stop persistent signer workers"""
+    if signing_service:
+        await signing_service.stop_workers()
+
+async def stop_batch_writer():
+    """Stop the batch writer"""
+    if batch_writer_task:
+        batch_writer_task.cancel()
+
+async def get_db():
     """Database dependency"""
-    db = SessionLocal()
-    try:
+    async with AsyncSessionLocal() as db:
         yield db
-    finally:
-        db.close()
+
+async def write_pending_inserts(queue: asyncio.Queue):
+    """Commit queued upload records, up to INSERT_BATCH_SIZE per transaction"""
+    while True:
+        batch = [await queue.get()]
+        while len(batch) < INSERT_BATCH_SIZE and not queue.empty():
+            batch.append(queue.get_nowait())
+        
+        try:
+            async with AsyncSessionLocal() as db:
+                db.add_all(db_video for db_video, _ in batch)
+                await db.commit()
+        except Exception as e:
+            logger.error(f"Failed to insert {len(batch)} video records: {str(e)}")
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+        except BaseException:
+            # Cancelled mid-commit; don't leave these uploads waiting
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(RuntimeError("Batch writer stopped"))
+            raise
+        else:
+            for db_video, future in batch:
+                if not future.done():
+                    future.set_result(db_video.id)
+
+def fail_pending_inserts(queue: asyncio.Queue, task: asyncio.Task):
+    """Fail uploads still queued when the batch writer stops, so they don't wait forever"""
+    if not task.cancelled() and task.exception():
+        logger.error(f"Batch writer crashed: {task.exception()}")
+    while not queue.empty():
+        _, future = queue.get_nowait()
+        if not future.done():
+            future.set_exception(RuntimeError("Batch writer stopped"))
+
+async def insert_video_record(db_video: SignedVideo) -> int:
+    """Queue a new record for the batch writer and wait for its id"""
+    if batch_writer_task is None or batch_writer_task.done():
+        raise RuntimeError("Batch writer is not running")
+    
+    future = asyncio.get_running_loop().create_future()
+    pending_inserts.put_nowait((db_video, future))
+    return await future
+
+def touch_signed_video(path: str) -> os.stat_result:
+    """
+    Record an access to a signed video for LRU eviction
+    
+    atime is set explicitly because mounts commonly use noatime/relatime.
+    Raises FileNotFoundError if the video has been evicted.
+    """
+    stat_result = os.stat(path)
+    os.utime(path, ns=(time.time_ns(), stat_result.st_mtime_ns))
+    # Stat again: an eviction pass may have unlinked it after the first one
+    return os.stat(path)
 
 @app.post("/upload-video/")
 async def upload_video(
@@ -281,32 +697,113 @@ async def upload_video(
     """
     
     # Validate file format
-    if not signing_service.is_supported_format(file.filename):
+    suffix = os.path.splitext(file.filename)[1].lower()
+    if not signing_service.is_supported_format(suffix):
         raise HTTPException(
             status_code=400, 
-            detail=f"Unsupported file format. Supported: {config.supported_formats}"
+            detail=f"Unsupported file format. Supported: {', '.join(sorted(config.supported_formats))}"
+        )
+    
+    # By the time this handler runs, Starlette has already received and
+    # spooled the whole multipart body; only UploadSizeLimitMiddleware
+    # rejects anything before it is read. The checks below just stop
+    # oversized or mislabelled files from being copied, hashed and signed.
+    
+    # Chunked uploads carry no Content-Length for the middleware to check
+    if file.size and file.size > config.max_upload_bytes:
+        raise HTTPException(
+            status_code=413,
+            detail=f"Upload exceeds maximum size of {config.max_upload_bytes} bytes"
+        )
+    
+    # Sniff the container before copying the upload into temp_dir
+    chunk = await file.read(CHUNK_SIZE)
+    if not signing_service.has_valid_container(suffix, chunk):
+        raise HTTPException(
+            status_code=415,
+            detail="File content does not match its video format"
         )
     
     # Save uploaded file temporarily
     temp_file_path = None
     try:
-        with tempfile.NamedTemporaryFile(delete=False, suffix=Path(file.filename).suffix) as temp_file:
-            temp_file_path = temp_file.name
-            content = await file.read()
-            temp_file.write(content)
+        # Stream to disk in fixed-size chunks, hashing each chunk on the way
+        # through so the file never sits in memory and is only read once
+        loop = asyncio.get_running_loop()
+        hash_sha256 = hashlib.sha256()
+        fd, temp_file_path = tempfile.mkstemp(suffix=suffix, dir=config.temp_dir)
+        # Write through mkstemp's descriptor: reopening the path with "wb"
+        # would truncate away the preallocated blocks
+        async with aiofiles.open(fd, "wb", buffering=CHUNK_SIZE, closefd=True) as temp_file:
+            # Reserve the whole file in one allocation instead of growing it
+            # block by block as chunks are written
+            if file.size and hasattr(os, "posix_fallocate"):
+                try:
+                    await loop.run_in_executor(executor, os.posix_fallocate, fd, 0, file.size)
+                except OSError as e:
+                    logger.debug(f"Could not preallocate upload file: {e}")
+            
+            while chunk:
+                await loop.run_in_executor(executor, hash_sha256.update, chunk)
+                await temp_file.write(chunk)
+                chunk = await file.read(CHUNK_SIZE)
+            
+            # Drop any preallocated space beyond what was actually written
+            await temp_file.truncate()
+        file_hash = hash_sha256.hexdigest()
         
         # Create database record
-        db = next(get_db())
-        
         parsed_device_info = None
         if device_info:
             try:
-                parsed_device_info = json.loads(device_info)
-            except json.JSONDecodeError:
+                parsed_device_info = orjson.loads(device_info)
+            except orjson.JSONDecodeError:
                 logger.warning("Invalid device_info JSON provided")
         
-        # Calculate file hash for database
-        file_hash = signing_service.calculate_file_hash(temp_file_path)
+        # Identical content that is already signed (e.g. a client retrying
+        # after a dropped connection) shares the existing signed file
+        # instead of going through the signer again
+        async with AsyncSessionLocal() as db:
+            existing_video = await db.scalar(
+                select(SignedVideo)
+                .where(SignedVideo.file_hash == file_hash, SignedVideo.is_signed.is_(True))
+                .order_by(SignedVideo.id.desc())
+                .limit(1)
+            )
+        if existing_video:
+            # A dedup hit counts as a use, and the shared file is held so
+            # eviction can't remove it before the new record points at it
+            existing_path = os.path.join(config.persistent_dir, existing_video.signed_filename)
+            signing_service.hold_output(existing_path)
+            try:
+                await loop.run_in_executor(executor, touch_signed_video, existing_path)
+            except FileNotFoundError:
+                signing_service.release_output(existing_path)
+                existing_video = None
+        if existing_video:
+            try:
+                os.unlink(temp_file_path)
+                
+                db_video = SignedVideo(
+                    original_filename=file.filename,
+                    file_hash=file_hash,
+                    device_info=device_info,
+                    signed_filename=existing_video.signed_filename,
+                    signing_timestamp=existing_video.signing_timestamp,
+                    is_signed=True,
+                    signing_status="completed"
+                )
+                video_id = await insert_video_record(db_video)
+            finally:
+                signing_service.release_output(existing_path)
+            logger.info(f"Video {video_id} matches already signed video {existing_video.id}")
+            
+            return {
+                "message": "Video already signed",
+                "video_id": video_id,
+                "status": "completed",
+                "file_hash": file_hash
+            }
         
         db_video = SignedVideo(
             original_filename=file.filename,
@@ -314,22 +811,22 @@ async def upload_video(
             device_info=device_info,
             signing_status="processing"
         )
-        db.add(db_video)
-        db.commit()
-        db.refresh(db_video)
+        video_id = await insert_video_record(db_video)
+        status_events[video_id] = asyncio.Event()
         
         # Process video in background
         background_tasks.add_task(
             process_video_background,
-            db_video.id,
+            video_id,
             temp_file_path,
             file.filename,
+            file_hash,
             parsed_device_info
         )
         
         return {
             "message": "Video uploaded successfully",
-            "video_id": db_video.id,
+            "video_id": video_id,
             "status": "processing",
             "file_hash": file_hash
         }
@@ -342,64 +839,64 @@ async def upload_video(
         logger.error(f"Upload failed: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Upload failed: {str(e)}")
 
-async def process_video_background(video_id: int, temp_file_path: str, original_filename: str, device_info: Dict = None):
+async def process_video_background(video_id: int, temp_file_path: str, original_filename: str, file_hash: str, device_info: Dict = None):
     """Background task to process and sign video"""
-    db = SessionLocal()
-    
     try:
-        # Get database record
-        db_video = db.query(SignedVideo).filter(SignedVideo.id == video_id).first()
-        if not db_video:
-            logger.error(f"Video record {video_id} not found")
-            return
-        
         # Process the video
-        result = signing_service.process_video_file(temp_file_path, original_filename, device_info)
+        result = await signing_service.process_video_file(temp_file_path, original_filename, file_hash, device_info)
         
         if result["success"]:
-            # Update database record
-            db_video.signed_filename = result["signed_filename"]
-            db_video.signing_timestamp = datetime.utcnow()
-            db_video.is_signed = True
-            db_video.signing_status = "completed"
-            
+            values = {
+                "signed_filename": result["signed_filename"],
+                "signing_timestamp": datetime.utcnow(),
+                "is_signed": True,
+                "signing_status": "completed"
+            }
             logger.info(f"Successfully signed video {video_id}: {result['signed_filename']}")
         else:
-            # Update with error
-            db_video.signing_status = "failed"
-            db_video.error_message = result["error"]
-            
+            values = {
+                "signing_status": "failed",
+                "error_message": result["error"]
+            }
             logger.error(f"Failed to sign video {video_id}: {result['error']}")
         
-        db.commit()
-        
     except Exception as e:
         logger.error(f"Background processing failed for video {video_id}: {str(e)}")
-        
-        # Update database with error
-        db_video = db.query(SignedVideo).filter(SignedVideo.id == video_id).first()
-        if db_video:
-            db_video.signing_status = "failed"
-            db_video.error_message = str(e)
-            db.commit()
+        values = {
+            "signing_status": "failed",
+            "error_message": str(e)
+        }
     
     finally:
         # Clean up temporary file
         if os.path.exists(temp_file_path):
             os.unlink(temp_file_path)
-        db.close()
-
-@app.get("/video-status/{video_id}")
-async def get_video_status(video_id: int):
-    """Get signing status of uploaded video"""
-    db = next(get_db())
-    
-    db_video = db.query(SignedVideo).filter(SignedVideo.id == video_id).first()
-    if not db_video:
-        raise HTTPException(status_code=404, detail="Video not found")
     
+    # Record the outcome with a single UPDATE
+    signed_file_path = result["signed_file_path"] if values.get("is_signed") else None
+    try:
+        async with AsyncSessionLocal() as db:
+            update_result = await db.execute(
+                update(SignedVideo).where(SignedVideo.id == video_id).values(**values)
+            )
+            await db.commit()
+        if update_result.rowcount == 0:
+            logger.error(f"Video record {video_id} not found")
+    except Exception as e:
+        logger.error(f"Failed to record signing result for video {video_id}: {str(e)}")
+    finally:
+        # The record now says whether the signed video exists
+        if signed_file_path:
+            signing_service.release_output(signed_file_path)
+        # Wake any status WebSockets waiting on this video
+        event = status_events.pop(video_id, None)
+        if event:
+            event.set()
+
+def video_status(db_video: SignedVideo) -> Dict[str, Any]:
+    """Build the status payload for a video record"""
     return {
-        "video_id": video_id,
+        "video_id": db_video.id,
         "original_filename": db_video.original_filename,
         "file_hash": db_video.file_hash,
         "upload_timestamp": db_video.upload_timestamp,
@@ -410,40 +907,188 @@ async def get_video_status(video_id: int):
         "signed_filename": db_video.signed_filename
     }
 
-@app.get("/download-signed-video/{video_id}")
-async def download_signed_video(video_id: int):
-    """Download signed video file"""
-    db = next(get_db())
+@app.get("/video-status/{video_id}")
+async def get_video_status(video_id: int, db: AsyncSession = Depends(get_db)):
+    """Get signing status of uploaded video"""
+    db_video = (await db.execute(select(SignedVideo).where(SignedVideo.id == video_id))).scalar_one_or_none()
+    if not db_video:
+        raise HTTPException(status_code=404, detail="Video not found")
+    
+    # Returned as a response directly so orjson serializes the datetimes
+    # without a jsonable_encoder pass
+    return ORJSONResponse(video_status(db_video))
+
+async def wait_for_signing(video_id: int) -> Optional[SignedVideo]:
+    """Return a video's record once it is no longer processing (None if it doesn't exist)"""
+    while True:
+        event = status_events.get(video_id)
+        if event:
+            await event.wait()
+        
+        async with AsyncSessionLocal() as db:
+            db_video = await db.get(SignedVideo, video_id)
+        if not db_video or db_video.signing_status != "processing":
+            return db_video
+        
+        # Being signed by another worker process, so there is no event to wait on
+        await asyncio.sleep(STATUS_POLL_INTERVAL)
+
+async def wait_for_disconnect(websocket: WebSocket):
+    """Return once the client closes the WebSocket, ignoring anything it sends"""
+    while (await websocket.receive())["type"] != "websocket.disconnect":
+        pass
+
+@app.websocket("/ws/video-status/{video_id}")
+async def video_status_updates(websocket: WebSocket, video_id: int):
+    """
+    Push the final signing status of a video, then close
+    
+    Lets clients wait for signing to finish instead of polling
+    /video-status/{video_id}. After STATUS_WAIT_TIMEOUT the current status
+    is sent even if the video is still processing (e.g. a record left
+    behind by a restart).
+    """
+    await websocket.accept()
+    
+    signed = asyncio.create_task(wait_for_signing(video_id))
+    disconnected = asyncio.create_task(wait_for_disconnect(websocket))
+    try:
+        done, _ = await asyncio.wait(
+            {signed, disconnected},
+            timeout=STATUS_WAIT_TIMEOUT,
+            return_when=asyncio.FIRST_COMPLETED
+        )
+    finally:
+        signed.cancel()
+        disconnected.cancel()
+    
+    if disconnected in done:
+        return
+    
+    if signed in done:
+        db_video = signed.result()
+    else:
+        async with AsyncSessionLocal() as db:
+            db_video = await db.get(SignedVideo, video_id)
     
-    db_video = db.query(SignedVideo).filter(SignedVideo.id == video_id).first()
+    if not db_video:
+        await websocket.close(code=1008, reason="Video not found")
+        return
+    
+    await websocket.send_text(orjson.dumps(video_status(db_video)).decode())
+    await websocket.close()
+
+def range_not_satisfiable(file_size: int) -> HTTPException:
+    """Build the 416 response for a Range header that selects no bytes of the file"""
+    return HTTPException(
+        status_code=416,
+        detail="Requested range not satisfiable",
+        headers={"Content-Range": f"bytes */{file_size}"}
+    )
+
+def parse_byte_range(range_header: str, file_size: int) -> Optional[Tuple[int, int]]:
+    """
+    Parse a single-range "bytes=" Range header
+    
+    Returns:
+        Inclusive (start, end) offsets, or None if the header should be
+        ignored and the whole file served
+    """
+    unit, _, ranges = range_header.partition("=")
+    if unit.strip().lower() != "bytes" or "," in ranges:
+        return None
+    
+    start_str, sep, end_str = ranges.strip().partition("-")
+    try:
+        if not sep:
+            return None
+        if not start_str:
+            # Suffix range: the last N bytes
+            length = int(end_str)
+            if length < 0:
+                return None
+            if length == 0:
+                # A zero-length suffix selects no bytes at all
+                raise range_not_satisfiable(file_size)
+            start, end = max(file_size - length, 0), file_size - 1
+        else:
+            start = int(start_str)
+            end = int(end_str) if end_str else file_size - 1
+            if end_str and end < start:
+                return None
+    except ValueError:
+        return None
+    
+    if start >= file_size:
+        raise range_not_satisfiable(file_size)
+    return start, min(end, file_size - 1)
+
+async def iter_file_range(path: str, start: int, end: int):
+    """Yield bytes start..end (inclusive) of a file without blocking the event loop"""
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        offset = start
+        while offset <= end:
+            chunk = await run_in_threadpool(os.pread, fd, min(CHUNK_SIZE, end - offset + 1), offset)
+            if not chunk:
+                break
+            offset += len(chunk)
+            yield chunk
+    finally:
+        os.close(fd)
+
+@app.get("/download-signed-video/{video_id}")
+async def download_signed_video(video_id: int, request: Request):
+    """Download signed video file, honouring single-range Range requests"""
+    # Scoped session rather than Depends(get_db), so the pooled connection
+    # is returned before the file transfer starts
+    async with AsyncSessionLocal() as db:
+        db_video = (await db.execute(select(SignedVideo).where(SignedVideo.id == video_id))).scalar_one_or_none()
     if not db_video:
         raise HTTPException(status_code=404, detail="Video not found")
     
     if not db_video.is_signed:
         raise HTTPException(status_code=400, detail="Video not yet signed")
     
-    signed_file_path = os.path.join(config.temp_dir, db_video.signed_filename)
-    if not os.path.exists(signed_file_path):
+    signed_file_path = os.path.join(config.persistent_dir, db_video.signed_filename)
+    try:
+        # Record the access for LRU eviction
+        stat_result = await run_in_threadpool(touch_signed_video, signed_file_path)
+    except FileNotFoundError:
         raise HTTPException(status_code=404, detail="Signed video file not found")
     
-    return FileResponse(
-        signed_file_path,
+    range_header = request.headers.get("range")
+    byte_range = parse_byte_range(range_header, stat_result.st_size) if range_header else None
+    if byte_range is None:
+        return FileResponse(
+            signed_file_path,
+            media_type="video/mp4",
+            filename=db_video.signed_filename,
+            stat_result=stat_result,
+            headers={"Accept-Ranges": "bytes"}
+        )
+    
+    start, end = byte_range
+    return StreamingResponse(
+        iter_file_range(signed_file_path, start, end),
+        status_code=206,
         media_type="video/mp4",
-        filename=db_video.signed_filename
+        headers={
+            "Accept-Ranges": "bytes",
+            "Content-Range": f"bytes {start}-{end}/{stat_result.st_size}",
+            "Content-Length": str(end - start + 1),
+            "Content-Disposition": f"attachment; filename*=utf-8''{quote(db_video.signed_filename)}"
+        }
     )
 
 @app.get("/health")
 async def health_check():
     """Health check endpoint"""
-    return {
+    return ORJSONResponse({
         "status": "healthy",
         "timestamp": datetime.utcnow(),
-        "dependencies": {
-            "signed_video_lib": os.path.exists(config.signed_video_lib_path),
-            "signer_executable": os.path.exists(config.signer_executable),
-            "private_key": os.path.exists(config.private_key_path)
-        }
-    }
+        "dependencies": signing_service.dependencies
+    })
 
 if __name__ == "__main__":
     uvicorn.run(app, host="0.0.0.0", port=8000)